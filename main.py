@@ -1,5 +1,7 @@
 import streamlit as st
-from src.app.app import PDFQuestionAnsweringApp
+from src.app.app import PDFQuestionAnsweringApp, load_environment
+
+load_environment()
 
 class PDFQuestionAnsweringAppRunner:
     """Runner class for the PDF Question Answering Streamlit application."""
@@ -1,10 +1,45 @@
 import os
+import queue
 import streamlit as st
 import tempfile
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from src.rag.embeddings import HuggingFaceEmbeddingsWrapper
 from src.rag.rag_system import PDFRAGSystem
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Tuple
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit
+UPLOAD_CHUNK_SIZE = 1 << 20
+PROGRESS_POLL_INTERVAL = 0.5  # seconds between progress fragment reruns
+
+# Shared across sessions so PDF processing never blocks the script-runner thread
+_PROCESSING_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+@lru_cache(maxsize=None)
+def load_environment() -> None:
+    """Load environment variables from the .env file once per process."""
+    load_dotenv()
+
+@st.cache_resource
+def get_embeddings() -> HuggingFaceEmbeddingsWrapper:
+    """Load the embeddings model once and share it across all sessions."""
+    return HuggingFaceEmbeddingsWrapper()
+
+def _remove_temp_file(temp_path: str) -> None:
+    """Delete a temporary file, logging instead of raising on failure."""
+    try:
+        os.unlink(temp_path)
+    except Exception as e:
+        print(f"Warning: Failed to delete temporary file: {str(e)}")
+
+def _process_upload(rag_system: PDFRAGSystem, temp_path: str, file_hash: str, progress_queue: queue.Queue) -> str:
+    """Process an uploaded PDF in a worker thread and remove its temporary file afterwards."""
+    try:
+        return rag_system.process_pdf(temp_path, doc_hash=file_hash, progress_queue=progress_queue)
+    finally:
+        _remove_temp_file(temp_path)
 
 class PDFQuestionAnsweringApp:
     """Streamlit application for PDF question answering using RAG."""
@@ -12,7 +47,7 @@ class PDFQuestionAnsweringApp:
     def __init__(self):
         """Initialize the Streamlit application with RAG system."""
         try:
-            load_dotenv()
+            load_environment()
             self._initialize_rag_system()
             self.initialize_session_state()
         except Exception as e:
@@ -25,7 +60,7 @@ class PDFQuestionAnsweringApp:
             api_key = os.getenv("GROQ_API_KEY")
             if not api_key:
                 raise ValueError("GROQ_API_KEY not found in environment variables")
-            st.session_state.rag_system = PDFRAGSystem(api_key=api_key)
+            st.session_state.rag_system = PDFRAGSystem(api_key=api_key, embeddings=get_embeddings())
         self.rag_system = st.session_state.rag_system
 
     def initialize_session_state(self) -> None:
@@ -34,7 +69,8 @@ class PDFQuestionAnsweringApp:
             'messages': [],
             'pdf_processed': False,
             'pdf_name': "",
-            'pdf_hash': None
+            'pdf_hash': None,
+            'last_file_id': None
         }
         for key, value in defaults.items():
             if key not in st.session_state:
@@ -70,37 +106,29 @@ class PDFQuestionAnsweringApp:
                 key="pdf_uploader"
             )
             
-            if uploaded_file is not None:
-                file_content = uploaded_file.getvalue()
-                if len(file_content) > 10 * 1024 * 1024:  # 10MB limit
+            outcome = st.session_state.pop('processing_result', None)
+            if outcome is not None:
+                level, message = outcome
+                getattr(st, level)(message)
+
+            if st.session_state.get('processing') is not None:
+                self._render_processing_status()
+            elif uploaded_file is not None and uploaded_file.file_id != st.session_state.get('last_file_id'):
+                saved = self._save_upload(uploaded_file)
+                if saved is None:
                     st.error("❌ File size exceeds 10MB limit")
                     return
-                
-                file_hash = hashlib.md5(file_content).hexdigest()
+                temp_path, file_hash = saved
+                st.session_state.last_file_id = uploaded_file.file_id
                 
                 if file_hash != st.session_state.get('pdf_hash'):
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                        tmp_file.write(file_content)
-                        temp_path = tmp_file.name
-                    
-                    with st.spinner("Processing PDF..."):
-                        result = self.rag_system.process_pdf(temp_path)
-                        if "Successfully processed" in result:
-                            st.session_state.pdf_processed = True
-                            st.session_state.pdf_name = uploaded_file.name
-                            st.session_state.pdf_hash = file_hash
-                            st.success(f"✅ {result}")
-                            try:
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Failed to refresh page: {str(e)}")
-                        else:
-                            st.error(f"❌ {result}")
-                    
+                    self._start_processing(temp_path, file_hash, uploaded_file.name)
                     try:
-                        os.unlink(temp_path)
+                        st.rerun()
                     except Exception as e:
-                        print(f"Warning: Failed to delete temporary file: {str(e)}")
+                        st.error(f"Failed to refresh page: {str(e)}")
+                else:
+                    _remove_temp_file(temp_path)
             
             if st.session_state.get('pdf_processed', False):
                 st.markdown("---")
@@ -110,12 +138,94 @@ class PDFQuestionAnsweringApp:
                     st.session_state.pdf_processed = False
                     st.session_state.pdf_name = ""
                     st.session_state.pdf_hash = None
+                    st.session_state.last_file_id = None
                     st.success("Chat history and PDF cleared!")
                     try:
                         st.rerun()
                     except Exception as e:
                         st.error(f"Failed to refresh page: {str(e)}")
 
+    def _save_upload(self, uploaded_file) -> Optional[Tuple[str, str]]:
+        """
+        Stream an uploaded file to a temporary PDF while hashing it in a single pass.
+
+        Args:
+            uploaded_file: The Streamlit UploadedFile to save.
+
+        Returns:
+            Optional[Tuple[str, str]]: The temporary file path and hex digest, or None
+            if the file exceeds MAX_FILE_SIZE.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        uploaded_file.seek(0)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+            temp_path = tmp_file.name
+            while chunk := uploaded_file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    break
+                digest.update(chunk)
+                tmp_file.write(chunk)
+        if size > MAX_FILE_SIZE:
+            _remove_temp_file(temp_path)
+            return None
+        return temp_path, digest.hexdigest()
+
+    def _start_processing(self, temp_path: str, file_hash: str, file_name: str) -> None:
+        """
+        Submit PDF processing to the background executor and record it in session state.
+
+        Args:
+            temp_path (str): Path to the temporary PDF file, removed once processing ends.
+            file_hash (str): Content hash of the PDF.
+            file_name (str): Original name of the uploaded file.
+        """
+        progress_queue = queue.Queue()
+        future = _PROCESSING_EXECUTOR.submit(
+            _process_upload, self.rag_system, temp_path, file_hash, progress_queue
+        )
+        # The current PDF stays loaded until the new one is processed successfully
+        st.session_state.processing = {
+            'future': future,
+            'queue': progress_queue,
+            'progress': (0.0, "Queued..."),
+            'name': file_name,
+            'hash': file_hash
+        }
+
+    @st.fragment(run_every=PROGRESS_POLL_INTERVAL)
+    def _render_processing_status(self) -> None:
+        """Poll the background PDF job, showing its progress and finalizing session state once it completes."""
+        processing = st.session_state.get('processing')
+        if processing is None:
+            return
+
+        while True:
+            try:
+                processing['progress'] = processing['queue'].get_nowait()
+            except queue.Empty:
+                break
+
+        if not processing['future'].done():
+            fraction, message = processing['progress']
+            st.progress(fraction, text=f"Processing {processing['name']}: {message}")
+            return
+
+        del st.session_state.processing
+        result = processing['future'].result()
+        if "Successfully processed" in result:
+            st.session_state.pdf_processed = True
+            st.session_state.pdf_name = processing['name']
+            st.session_state.pdf_hash = processing['hash']
+            st.session_state.processing_result = ("success", f"✅ {result}")
+        else:
+            st.session_state.processing_result = ("error", f"❌ {result}")
+        try:
+            st.rerun()
+        except Exception as e:
+            st.error(f"Failed to refresh page: {str(e)}")
+
     def render_welcome_screen(self) -> None:
         """Render welcome screen when no PDF is loaded."""
         st.markdown("""
@@ -139,8 +249,9 @@ class PDFQuestionAnsweringApp:
         - Concise, focused answers (max 3 sentences)
         """)
 
+    @st.fragment
     def render_chat_interface(self) -> None:
-        """Render chat interface when PDF is loaded."""
+        """Render chat interface when PDF is loaded, rerunning only this fragment on new messages."""
         st.header(f"💬 Chat with: {st.session_state.get('pdf_name', 'Unknown')}")
         
         for message in st.session_state.get('messages', []):
@@ -157,8 +268,6 @@ class PDFQuestionAnsweringApp:
                 st.markdown(prompt)
             
             with st.chat_message("assistant"):
-                with st.spinner("🤔 Thinking..."):
-                    response = self.rag_system.query(prompt)
-                    st.markdown(response)
+                response = st.write_stream(self.rag_system.stream_query(prompt))
             
             st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
@@ -1,37 +1,73 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from typing import List, Optional
-from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+from functools import lru_cache
+import numpy as np
+import threading
+from typing import List, Optional, Tuple
 import os
 
-class HuggingFaceEmbeddingsWrapper:
-    """Wrapper for HuggingFace embeddings compatible with Chroma vector store."""
+class HuggingFaceEmbeddingsWrapper(Embeddings):
+    """Wrapper for HuggingFace embeddings compatible with LangChain vector stores."""
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", hf_token: Optional[str] = None):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        hf_token: Optional[str] = None,
+        batch_size: int = 64,
+        query_cache_size: int = 1024
+    ):
         """
         Initialize HuggingFace embeddings with a specified model.
 
         Args:
             model_name (str): Name of the HuggingFace model to use for embeddings. Defaults to 'sentence-transformers/all-MiniLM-L6-v2'.
             hf_token (Optional[str]): Hugging Face API token for authenticated access. Defaults to None.
+            batch_size (int): Number of texts encoded per forward pass. Defaults to 64.
+            query_cache_size (int): Maximum number of query embeddings kept in the LRU cache. Defaults to 1024.
         
         Raises:
             RuntimeError: If initialization fails due to connection or authentication issues.
         """
         try:
-            load_dotenv()  # Load environment variables from .env file
             # Set HF_TOKEN globally if provided or available in environment
             if hf_token or os.getenv("HF_TOKEN"):
                 os.environ["HF_TOKEN"] = hf_token or os.getenv("HF_TOKEN")
 
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name=model_name,
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
-            )
+            self.model_name = model_name
+            self.batch_size = batch_size
+            # The model is shared across sessions and its fast tokenizer is not thread-safe;
+            # torch's default intra-op threads already parallelize each forward pass
+            self._encode_lock = threading.Lock()
+            self._model = SentenceTransformer(model_name, device='cpu')
+            # Per-instance cache so repeated or replayed questions skip the forward pass
+            self._embed_query_cached = lru_cache(maxsize=query_cache_size)(self._embed_query_uncached)
             print(f"✅ Initialized HuggingFace embeddings with model: {model_name}")
         except Exception as e:
             raise RuntimeError(f"Failed to initialize embeddings: {str(e)}")
 
+    def _encode(self, texts: List[str]):
+        """Encode texts into L2-normalized embeddings as a NumPy array."""
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            # Release the lock between batches so queries from other sessions can interleave
+            with self._encode_lock:
+                batches.append(self._model.encode(
+                    texts[start:start + self.batch_size],
+                    batch_size=self.batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=False,
+                    show_progress_bar=False
+                ))
+        vectors = np.concatenate(batches)
+        # Normalize the whole batch in one vectorized pass so inner product equals cosine similarity
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-12)
+        return vectors
+
+    def _embed_query_uncached(self, text: str) -> Tuple[float, ...]:
+        """Embed a single query text as an immutable tuple suitable for caching."""
+        return tuple(self._encode([text])[0].tolist())
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
         Embed a list of documents.
@@ -42,12 +78,30 @@ class HuggingFaceEmbeddingsWrapper:
         Returns:
             List[List[float]]: List of embedding vectors for the documents.
 
+        Raises:
+            ValueError: If texts is empty or not a list of strings.
+        """
+        return self.embed_documents_np(texts).tolist()
+
+    def embed_documents_np(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a list of documents into a packed float32 matrix.
+
+        Avoids boxing every component into a Python float when the caller
+        feeds the vectors straight into a vector index.
+
+        Args:
+            texts (List[str]): List of document texts to embed.
+
+        Returns:
+            np.ndarray: Array of shape (len(texts), dim) with L2-normalized embeddings.
+
         Raises:
             ValueError: If texts is empty or not a list of strings.
         """
         if not texts or not isinstance(texts, list):
             raise ValueError("Input must be a non-empty list of strings")
-        return self.embeddings.embed_documents(texts)
+        return self._encode(texts)
 
     def embed_query(self, text: str) -> List[float]:
         """
@@ -64,4 +118,4 @@ class HuggingFaceEmbeddingsWrapper:
         """
         if not text or not isinstance(text, str):
             raise ValueError("Input must be a non-empty string")
-        return self.embeddings.embed_query(text)
\ No newline at end of file
+        return list(self._embed_query_cached(text))
\ No newline at end of file
@@ -1,35 +1,104 @@
+import faiss
+import pickle
+import queue
+import shutil
 import tempfile
+import threading
 from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_groq import ChatGroq
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from src.rag.embeddings import HuggingFaceEmbeddingsWrapper
-from typing import Optional
-from dotenv import load_dotenv
+from transformers import AutoTokenizer
+from functools import lru_cache
+from typing import Iterator, List, Optional
 import os
 
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "pdfrag")
+MAX_HISTORY_TURNS = 6
+CHUNK_SIZE = 256  # tokens, matching the MiniLM input window
+CHUNK_OVERLAP = 32
+# Cache file names include the split settings and index type so changing either invalidates old caches
+_SPLIT_TAG = f"tok{CHUNK_SIZE}-{CHUNK_OVERLAP}"
+_INDEX_NAME = f"index-fp16-{_SPLIT_TAG}"
+# Fast tokenizers are not thread-safe, and background jobs may split concurrently
+_SPLIT_LOCK = threading.Lock()
+
+_CONTEXTUALIZE_Q_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", (
+        "Given a chat history and the latest user question "
+        "which might reference context in the chat history, "
+        "formulate a standalone question which can be understood "
+        "without the chat history. Do NOT answer the question, just "
+        "reformulate it if needed and otherwise return it as is."
+    )),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+_QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", (
+        "You are a helpful AI assistant answering questions only based on the provided document. "
+        "IMPORTANT: Keep all responses short and concise – maximum 3 sentences. "
+        "Provide only the most essential information as a clear overview. "
+        "Give direct, brief answers that summarize the key points from the document. "
+        "If the user asks about anything unrelated to this PDF, respond ONLY with: 'Out of context' "
+        "\nContext: {context}"
+    )),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+@lru_cache(maxsize=None)
+def _get_text_splitter(model_name: str) -> RecursiveCharacterTextSplitter:
+    """
+    Build a token-aware splitter with its own tokenizer, separate from the embedding model's.
+
+    Args:
+        model_name (str): HuggingFace model whose tokenizer measures chunk length.
+
+    Returns:
+        RecursiveCharacterTextSplitter: The cached splitter.
+    """
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        AutoTokenizer.from_pretrained(model_name),
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
 class PDFRAGSystem:
     """A Retrieval-Augmented Generation system for processing PDFs and answering questions."""
 
-    def __init__(self, api_key: str, model: str = "llama-3.3-70b-versatile"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "llama-3.3-70b-versatile",
+        embeddings: Optional[HuggingFaceEmbeddingsWrapper] = None
+    ):
         """
         Initialize the PDF RAG system.
 
         Args:
             api_key (str): API key for Groq model.
             model (str): Name of the Groq model to use. Defaults to 'llama-3.3-70b-versatile'.
+            embeddings (Optional[HuggingFaceEmbeddingsWrapper]): Shared embeddings instance to reuse.
+                Defaults to None, which loads a new one.
         
         Raises:
             RuntimeError: If initialization fails.
         """
         try:
-            load_dotenv()  # Load environment variables from .env file
-            self.embeddings = HuggingFaceEmbeddingsWrapper()
+            self.embeddings = embeddings or HuggingFaceEmbeddingsWrapper()
             self.llm = ChatGroq(model=model, api_key=api_key)
+            # Independent of the retriever, so it is built once and reused for every PDF
+            self.question_answer_chain = create_stuff_documents_chain(self.llm, _QA_PROMPT)
             self.vector_store = None
             self.rag_chain = None
             self.chat_history = []
@@ -37,12 +106,22 @@ class PDFRAGSystem:
         except Exception as e:
             raise RuntimeError(f"Failed to initialize PDFRAGSystem: {str(e)}")
 
-    def process_pdf(self, pdf_path: str) -> str:
+    def process_pdf(
+        self,
+        pdf_path: str,
+        doc_hash: Optional[str] = None,
+        progress_queue: Optional[queue.Queue] = None
+    ) -> str:
         """
         Process a PDF file and create a vector store.
 
+        When a document hash is given, the FAISS index is persisted under
+        CACHE_ROOT/<doc_hash> and reloaded on later uploads of the same file.
+
         Args:
             pdf_path (str): Path to the PDF file.
+            doc_hash (Optional[str]): Content hash of the PDF used as cache key. Defaults to None.
+            progress_queue (Optional[queue.Queue]): Queue receiving (fraction, message) milestones. Defaults to None.
 
         Returns:
             str: Status message indicating success or failure.
@@ -51,26 +130,22 @@ class PDFRAGSystem:
             if not pdf_path.endswith('.pdf'):
                 return "❌ Invalid file format: Please provide a PDF file."
 
-            print(f"📄 Loading PDF: {pdf_path}")
-            loader = PyPDFLoader(pdf_path)
-            documents = loader.load()
-            print(f"📖 Loaded {len(documents)} pages")
+            persist_dir = os.path.join(CACHE_ROOT, doc_hash) if doc_hash else None
+            vector_store = self._load_cached_index(persist_dir, progress_queue) if persist_dir else None
+            if vector_store is None:
+                chunks = self._load_chunks(pdf_path, persist_dir, progress_queue)
+                if not chunks:
+                    return "❌ Error processing PDF: No text could be extracted."
 
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len
-            )
-            chunks = text_splitter.split_documents(documents)
-            print(f"Split into {len(chunks)} chunks")
-
-            temp_dir = tempfile.mkdtemp()
-            print("🔍 Creating vector store...")
-            self.vector_store = Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
-                persist_directory=temp_dir
-            )
+                print("🔍 Creating vector store...")
+                self._report_progress(progress_queue, 0.4, f"Embedding {len(chunks)} chunks...")
+                vector_store = self._build_vector_store(chunks)
+                if persist_dir:
+                    self._save_index(vector_store, persist_dir)
+            self.vector_store = vector_store
+            num_chunks = self.vector_store.index.ntotal
+
+            self._report_progress(progress_queue, 0.9, "Setting up RAG chain...")
 
             retriever = self.vector_store.as_retriever(
                 search_type="similarity",
@@ -78,14 +153,183 @@ class PDFRAGSystem:
             )
             self._setup_rag_chain(retriever)
             
-            result = f"Successfully processed PDF with {len(chunks)} chunks."
+            result = f"Successfully processed PDF with {num_chunks} chunks."
             print(result)
+            self._report_progress(progress_queue, 1.0, "Done")
             return result
         except Exception as e:
             error_msg = f"❌ Error processing PDF: {str(e)}"
             print(error_msg)
             return error_msg
 
+    def _load_chunks(
+        self,
+        pdf_path: str,
+        cache_dir: Optional[str] = None,
+        progress_queue: Optional[queue.Queue] = None
+    ) -> List[Document]:
+        """
+        Load a PDF and split it into chunks, reusing a pickled result when available.
+
+        The chunk cache is kept separate from the vector store so that either
+        can be invalidated on its own.
+
+        Args:
+            pdf_path (str): Path to the PDF file.
+            cache_dir (Optional[str]): Directory holding the chunk cache. Defaults to None.
+            progress_queue (Optional[queue.Queue]): Queue receiving (fraction, message) milestones. Defaults to None.
+
+        Returns:
+            List[Document]: The document chunks.
+        """
+        chunks_path = os.path.join(cache_dir, f"chunks-{_SPLIT_TAG}.pkl") if cache_dir else None
+        if chunks_path and os.path.exists(chunks_path):
+            try:
+                with open(chunks_path, "rb") as f:
+                    chunks = pickle.load(f)
+                print(f"♻️ Loaded {len(chunks)} cached chunks")
+                return chunks
+            except Exception as e:
+                print(f"Warning: Ignoring unreadable chunk cache, rebuilding: {str(e)}")
+
+        print(f"📄 Loading PDF: {pdf_path}")
+        self._report_progress(progress_queue, 0.1, "Loading PDF...")
+        loader = PyMuPDFLoader(pdf_path)
+        documents = loader.load()
+        print(f"📖 Loaded {len(documents)} pages")
+        self._report_progress(progress_queue, 0.25, f"Splitting {len(documents)} pages...")
+
+        with _SPLIT_LOCK:
+            chunks = _get_text_splitter(self.embeddings.model_name).split_documents(documents)
+        print(f"Split into {len(chunks)} chunks")
+
+        if chunks_path and chunks:
+            self._save_chunks(chunks, chunks_path)
+        return chunks
+
+    @staticmethod
+    def _save_chunks(chunks: List[Document], chunks_path: str) -> None:
+        """
+        Pickle chunks to the cache, logging instead of raising if the cache is not writable.
+
+        Args:
+            chunks (List[Document]): The document chunks to cache.
+            chunks_path (str): Destination path of the chunk cache.
+        """
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(chunks_path), exist_ok=True)
+            # Write to a temporary file first so readers never see a truncated pickle
+            with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(chunks_path), suffix=".tmp", delete=False
+            ) as tmp_file:
+                tmp_path = tmp_file.name
+                pickle.dump(chunks, tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, chunks_path)
+        except Exception as e:
+            print(f"Warning: Failed to write chunk cache: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _load_cached_index(
+        self,
+        persist_dir: str,
+        progress_queue: Optional[queue.Queue] = None
+    ) -> Optional[FAISS]:
+        """
+        Load a persisted FAISS index if both of its files are present and readable.
+
+        Args:
+            persist_dir (str): Directory holding the cached index.
+            progress_queue (Optional[queue.Queue]): Queue receiving (fraction, message) milestones. Defaults to None.
+
+        Returns:
+            Optional[FAISS]: The loaded vector store, or None if it must be rebuilt.
+        """
+        index_files = [os.path.join(persist_dir, f"{_INDEX_NAME}{ext}") for ext in (".faiss", ".pkl")]
+        if not all(os.path.exists(path) for path in index_files):
+            return None
+
+        print(f"♻️ Loading cached vector store: {persist_dir}")
+        self._report_progress(progress_queue, 0.5, "Loading cached index...")
+        try:
+            # The index was written by this application into its own cache directory
+            return FAISS.load_local(
+                persist_dir,
+                self.embeddings,
+                index_name=_INDEX_NAME,
+                allow_dangerous_deserialization=True,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+            )
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable index cache, rebuilding: {str(e)}")
+            return None
+
+    def _save_index(self, vector_store: FAISS, persist_dir: str) -> None:
+        """
+        Persist a FAISS index so that concurrent or interrupted writes never leave partial files.
+
+        Failures are logged rather than raised, since the in-memory index is still usable.
+
+        Args:
+            vector_store (FAISS): The vector store to persist.
+            persist_dir (str): Directory holding the cached index.
+        """
+        tmp_dir = None
+        try:
+            os.makedirs(persist_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=persist_dir)
+            vector_store.save_local(tmp_dir, index_name=_INDEX_NAME)
+            # The .faiss file is moved last, so a cache hit always finds its .pkl too
+            for ext in (".pkl", ".faiss"):
+                os.replace(
+                    os.path.join(tmp_dir, f"{_INDEX_NAME}{ext}"),
+                    os.path.join(persist_dir, f"{_INDEX_NAME}{ext}")
+                )
+        except Exception as e:
+            print(f"Warning: Failed to write index cache: {str(e)}")
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _build_vector_store(self, chunks: List[Document]) -> FAISS:
+        """
+        Embed chunks and index them in a FAISS store holding FP16 vectors.
+
+        Args:
+            chunks (List[Document]): The document chunks to index.
+
+        Returns:
+            FAISS: The vector store searched by inner product.
+        """
+        vectors = self.embeddings.embed_documents_np([chunk.page_content for chunk in chunks])
+        # Store vectors as FP16 to halve index memory; search still takes float32 queries
+        index = faiss.IndexScalarQuantizer(
+            vectors.shape[1], faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+        index.add(vectors)
+        ids = [str(i) for i in range(len(chunks))]
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(ids, chunks))),
+            index_to_docstore_id=dict(enumerate(ids)),
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+
+    @staticmethod
+    def _report_progress(progress_queue: Optional[queue.Queue], fraction: float, message: str) -> None:
+        """
+        Publish a processing milestone if a progress queue was supplied.
+
+        Args:
+            progress_queue (Optional[queue.Queue]): Queue to publish to.
+            fraction (float): Completed fraction between 0 and 1.
+            message (str): Human-readable description of the current step.
+        """
+        if progress_queue is not None:
+            progress_queue.put((fraction, message))
+
     def _setup_rag_chain(self, retriever) -> None:
         """
         Setup the RAG chain with history awareness.
@@ -96,41 +340,12 @@ class PDFRAGSystem:
         try:
             print("🔗 Setting up RAG chain...")
             
-            contextualize_q_system_prompt = (
-                "Given a chat history and the latest user question "
-                "which might reference context in the chat history, "
-                "formulate a standalone question which can be understood "
-                "without the chat history. Do NOT answer the question, just "
-                "reformulate it if needed and otherwise return it as is."
-            )
-            
-            contextualize_q_prompt = ChatPromptTemplate.from_messages([
-                ("system", contextualize_q_system_prompt),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ])
-            
+            # With an empty chat_history this branches straight to the retriever,
+            # so the first question never pays for a reformulation LLM call.
             history_aware_retriever = create_history_aware_retriever(
-                self.llm, retriever, contextualize_q_prompt
+                self.llm, retriever, _CONTEXTUALIZE_Q_PROMPT
             )
-            
-            qa_system_prompt = (
-            "You are a helpful AI assistant answering questions only based on the provided document. "
-            "IMPORTANT: Keep all responses short and concise – maximum 3 sentences. "
-            "Provide only the most essential information as a clear overview. "
-            "Give direct, brief answers that summarize the key points from the document. "
-            "If the user asks about anything unrelated to this PDF, respond ONLY with: 'Out of context' "
-            "\nContext: {context}"
-        )
-            
-            qa_prompt = ChatPromptTemplate.from_messages([
-                ("system", qa_system_prompt),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ])
-            
-            question_answer_chain = create_stuff_documents_chain(self.llm, qa_prompt)
-            self.rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+            self.rag_chain = create_retrieval_chain(history_aware_retriever, self.question_answer_chain)
             print("✅ RAG chain setup complete!")
         except Exception as e:
             raise RuntimeError(f"Failed to setup RAG chain: {str(e)}")
@@ -145,30 +360,128 @@ class PDFRAGSystem:
         Returns:
             str: The answer or an error message.
         """
-        if not self.rag_chain:
-            return "Please upload and process a PDF first."
-        
+        error_msg = self._validate_question(question)
+        if error_msg:
+            return error_msg
+
         try:
-            if not question or not isinstance(question, str):
-                return "Invalid question: Please provide a non-empty string."
-                
-            print(f"❓ Processing query: {question}")
-            result = self.rag_chain.invoke({
-                "input": question, 
-                "chat_history": self.chat_history
-            })
-            
-            answer = result['answer']
-            self.chat_history.append(HumanMessage(content=question))
-            self.chat_history.append(AIMessage(content=answer))
-            
-            print(f"💭 Generated answer: {answer[:100]}...")
-            return answer
+            result = self.rag_chain.invoke(self._chain_input(question))
+            return self._record_turn(question, result['answer'])
         except Exception as e:
-            error_msg = f"❌ Error processing query: {str(e)}"
-            print(error_msg)
+            return self._query_error(e)
+
+    async def aquery(self, question: str) -> str:
+        """
+        Asynchronously query the RAG system with a question.
+
+        Args:
+            question (str): The question to ask about the PDF content.
+
+        Returns:
+            str: The answer or an error message.
+        """
+        error_msg = self._validate_question(question)
+        if error_msg:
             return error_msg
 
+        try:
+            result = await self.rag_chain.ainvoke(self._chain_input(question))
+            return self._record_turn(question, result['answer'])
+        except Exception as e:
+            return self._query_error(e)
+
+    def stream_query(self, question: str) -> Iterator[str]:
+        """
+        Query the RAG system and yield the answer token by token.
+
+        The chat history is updated once the full answer has been streamed.
+
+        Args:
+            question (str): The question to ask about the PDF content.
+
+        Yields:
+            str: Fragments of the answer, or a single error message.
+        """
+        error_msg = self._validate_question(question)
+        if error_msg:
+            yield error_msg
+            return
+
+        try:
+            answer = ""
+            for chunk in self.rag_chain.stream(self._chain_input(question)):
+                token = chunk.get('answer')
+                if token:
+                    answer += token
+                    yield token
+            self._record_turn(question, answer)
+        except Exception as e:
+            yield self._query_error(e)
+
+    def _validate_question(self, question: str) -> Optional[str]:
+        """
+        Check that a PDF is loaded and the question is usable.
+
+        Args:
+            question (str): The question to validate.
+
+        Returns:
+            Optional[str]: An error message, or None if the question can be answered.
+        """
+        if not self.rag_chain:
+            return "Please upload and process a PDF first."
+        if not question or not isinstance(question, str):
+            return "Invalid question: Please provide a non-empty string."
+        return None
+
+    def _chain_input(self, question: str) -> dict:
+        """
+        Build the RAG chain input for a question.
+
+        Args:
+            question (str): The user question.
+
+        Returns:
+            dict: The input and current chat history.
+        """
+        print(f"❓ Processing query: {question}")
+        return {
+            "input": question,
+            "chat_history": self.chat_history
+        }
+
+    @staticmethod
+    def _query_error(error: Exception) -> str:
+        """
+        Format and log a query failure.
+
+        Args:
+            error (Exception): The exception raised while answering.
+
+        Returns:
+            str: The error message shown to the user.
+        """
+        error_msg = f"❌ Error processing query: {str(error)}"
+        print(error_msg)
+        return error_msg
+
+    def _record_turn(self, question: str, answer: str) -> str:
+        """
+        Append a question/answer pair to the chat history, keeping only the last MAX_HISTORY_TURNS turns.
+
+        Args:
+            question (str): The user question.
+            answer (str): The generated answer.
+
+        Returns:
+            str: The answer, unchanged.
+        """
+        self.chat_history.append(HumanMessage(content=question))
+        self.chat_history.append(AIMessage(content=answer))
+        self.chat_history = self.chat_history[-2 * MAX_HISTORY_TURNS:]
+        print(f"💭 Generated answer: {answer[:100]}...")
+        return answer
+
     def clear_history(self) -> None:
         """Clear the chat history."""
         self.chat_history = []